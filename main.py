@@ -1,15 +1,29 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
-from typing import List, Optional, Dict
-from PIL import Image, ImageDraw
+from fastapi.responses import FileResponse, ORJSONResponse, Response
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from typing import List, Optional, Dict, Tuple
+from PIL import Image
 from datetime import datetime
-import base64
+from collections import OrderedDict
+from dataclasses import dataclass
+import numpy as np
+import pybase64
+import asyncio
+import contextlib
+import functools
+import hashlib
+import io
+import mmap
 import os
+import tempfile
+import threading
+import time
 import uuid
+import weakref
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,17 +33,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 결과 카드 레이아웃
+SLOT_SIZE = 120
+CARD_MARGIN = 40  # 외곽 여백 (이 부분도 빨간 니트로 채워짐)
+
 class CreateRequest(BaseModel):
     text: str
-    columns: int 
+    columns: int = Field(gt=0)  # 카드 레이아웃 계산에 쓰이므로 1 이상
     open_time: str
 
 class JoinRequest(BaseModel):
     user_name: str
     message: str = ""
-    image_data: str = ""
+    image_data: bytes = b""  # "data:image/png;base64,..." (/join 은 본문 JSON 에서 바로 bytes 로 파싱)
 
-class Slot(BaseModel):
+@dataclass(slots=True)
+class Slot:
+    # /status 응답용 뷰 - orjson 이 dataclass 를 C 에서 바로 직렬화
     position: int
     char: str
     user: Optional[str] = None
@@ -38,11 +58,137 @@ class Slot(BaseModel):
     reserved_by: Optional[str] = None
 
 class RoomData(BaseModel):
-    slots: List[Slot]
+    # 슬롯별 필드를 배열/비트맵으로 분리 (SoA) → 예약/참여가 선형 탐색 없이 O(1)
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    chars: str
+    # 비트 i = 슬롯 i
+    filled_mask: int
+    reserved_mask: int = 0
+    free_mask: int  # 채워지지도 예약되지도 않은 슬롯 (공백 제외)
+    users: List[Optional[str]]
+    messages: List[Optional[str]]
+    reserved_by: List[Optional[str]]
+    reserved_by_user: Dict[str, int] = {}  # 이름 -> 예약한 슬롯
     columns: int
     open_time: str
+    open_minute: int  # open_time 을 unix 분 단위로 (요청마다 strftime 하지 않도록)
+    coords: List[Tuple[int, int]]  # 슬롯별 카드 좌표 (생성 시 한 번만 계산)
+    card_size: Tuple[int, int]
+    # 슬롯 이미지는 방마다 하나의 append-only blob 파일에 저장 (슬롯별 파일 대신)
+    image_index: Dict[int, Tuple[int, int]] = {}  # position -> (offset, length)
+    blob_size: int = 0  # 다음 append 위치 (이벤트 루프에서 미리 예약)
+    evicted: bool = False  # RoomCache 에서 밀려나 파일이 정리된 방
+    lock: asyncio.Lock = Field(default_factory=asyncio.Lock, exclude=True)  # 예약/참여 슬롯 배정용 (방마다 따로)
+    card_ready: bool = False  # 결과 카드가 만들어졌는지 (요청마다 exists 하지 않음)
+    card_sig: Optional[bytes] = None  # 마지막으로 렌더한 카드의 입력 시그니처
+    render_lock: asyncio.Lock = Field(default_factory=asyncio.Lock, exclude=True)  # 같은 방 카드 렌더 직렬화
+
+def _blob_path(room_id: str) -> str:
+    return f"room_{room_id}.blob"
+
+def _create_blob(blob_path: str):
+    os.close(os.open(blob_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644))
+
+def _write_blob(blob_path: str, offset: int, data: bytes):
+    # 버퍼드 파일 객체 없이 예약된 위치에 바로 pwrite (보통 syscall 한 번)
+    # O_CREAT 없음: 방이 정리된 뒤 늦게 도착한 쓰기가 blob 을 되살리지 않도록
+    fd = os.open(blob_path, os.O_WRONLY)
+    try:
+        view = memoryview(data)
+        while view:
+            n = os.pwrite(fd, view, offset)
+            view, offset = view[n:], offset + n
+    finally:
+        os.close(fd)
+
+def _read_file(path: str) -> bytes:
+    # fd 하나로 끝까지 읽음 → 중간에 os.replace 로 교체돼도 한 파일의 내용만 돌려줌
+    with open(path, "rb") as f: return f.read()
+
+def _read_blob(blob_path: str, offset: int, length: int) -> bytes:
+    fd = os.open(blob_path, os.O_RDONLY)
+    try: return os.pread(fd, length, offset)
+    finally: os.close(fd)
+
+def _is_filled(room: RoomData, idx: int) -> bool:
+    return (room.filled_mask >> idx) & 1 == 1
+
+def _pop_free_slot(room: RoomData) -> Optional[int]:
+    # free_mask 의 최하위 비트 = 가장 앞의 빈 슬롯
+    low = room.free_mask & -room.free_mask
+    if not low: return None
+    room.free_mask ^= low
+    return low.bit_length() - 1
+
+def _is_open(room: RoomData) -> bool:
+    return time.time() // 60 >= room.open_minute
+
+def _remove_room_files(room_id: str):
+    for path in (_blob_path(room_id), f"result_{room_id}.jpg"):
+        with contextlib.suppress(FileNotFoundError): os.remove(path)
 
-rooms_db: Dict[str, RoomData] = {}
+class RoomCache:
+    # 최근에 접근한 방만 유지하는 LRU (밀려난 방의 디스크 파일은 호출한 쪽에서 정리)
+    def __init__(self, max_rooms: int = 10_000):
+        self.max_rooms = max_rooms
+        self._d: "OrderedDict[str, RoomData]" = OrderedDict()
+
+    def get(self, room_id: str) -> Optional[RoomData]:
+        room = self._d.get(room_id)
+        if room is not None: self._d.move_to_end(room_id)
+        return room
+
+    def set(self, room_id: str, room: RoomData) -> List[str]:
+        self._d[room_id] = room
+        self._d.move_to_end(room_id)
+        evicted_ids = []
+        while len(self._d) > self.max_rooms:
+            evicted_id, evicted = self._d.popitem(last=False)
+            evicted.evicted = True
+            evicted_ids.append(evicted_id)
+        return evicted_ids
+
+ROOM_CACHE_MAX = 10_000  # 서버 메모리에 맞게 조정
+rooms_db = RoomCache(ROOM_CACHE_MAX)
+
+# 니트 구멍 점 하나 (PIL 3x3 ellipse 와 같은 + 모양)
+_KNIT_DOT = ((1, 0), (0, 1), (1, 1), (2, 1), (1, 2))
+
+@functools.lru_cache(maxsize=32)
+def _knit_background(width: int, height: int, bg_color: Tuple[int, int, int], dot_color: Tuple[int, int, int]) -> np.ndarray:
+    # 15px 간격 점 패턴을 슬라이스 대입으로 한 번에 그림 (같은 크기 방끼리 재사용)
+    bg = np.empty((height, width, 3), dtype=np.uint8)
+    bg[:] = bg_color
+    for dx, dy in _KNIT_DOT:
+        bg[dy::15, dx::15] = dot_color
+    bg.flags.writeable = False  # 캐시 공유 객체 - 복사해서 사용
+    return bg
+
+# 리사이즈된 참여자 이미지 LRU 캐시: (room_id, position, blob offset) -> uint8[120,120,3|4]
+THUMB_CACHE_MAX = 512
+_thumb_cache: "OrderedDict[Tuple[str, int, int], np.ndarray]" = OrderedDict()
+_thumb_lock = threading.Lock()  # 카드 렌더가 여러 스레드에서 동시에 돌 수 있음
+
+def _load_thumb(room_id: str, position: int, blob: mmap.mmap, offset: int, length: int) -> np.ndarray:
+    key = (room_id, position, offset)
+    with _thumb_lock:
+        thumb = _thumb_cache.get(key)
+        if thumb is not None:
+            _thumb_cache.move_to_end(key)
+            return thumb
+    src = Image.open(io.BytesIO(blob[offset:offset + length]))
+    src.draft("RGB", (SLOT_SIZE, SLOT_SIZE))  # JPEG 이면 libjpeg 단계에서 미리 축소
+    # 알파가 없거나 전부 불투명하면 RGB 로 두고 mask 없이 붙여넣기
+    if "A" in src.getbands() or "transparency" in src.info:
+        src = src.convert("RGBA")
+        if src.getextrema()[3][0] == 255: src = src.convert("RGB")
+    else:
+        src = src.convert("RGB")
+    thumb = np.asarray(src.resize((SLOT_SIZE, SLOT_SIZE), Image.Resampling.LANCZOS), dtype=np.uint8)
+    with _thumb_lock:
+        _thumb_cache[key] = thumb
+        if len(_thumb_cache) > THUMB_CACHE_MAX: _thumb_cache.popitem(last=False)
+    return thumb
 
 # ---- API ----
 
@@ -52,143 +198,236 @@ def get_config():
     return {"kakao_key": None}
 
 @app.post("/create")
-def create_room(request: CreateRequest):
+async def create_room(request: CreateRequest):
+    try: open_minute = int(datetime.fromisoformat(request.open_time).timestamp()) // 60
+    except ValueError: return {"error": "시간 형식이 올바르지 않습니다."}
     room_id = str(uuid.uuid4())[:8] 
-    new_slots = []
-    for i, char in enumerate(request.text.upper()):
-        is_blocked = (char == " ")
-        new_slots.append(Slot(position=i, char=char, is_filled=is_blocked))
+    chars = request.text.upper()
+    n = len(chars)
+    # 공백 자리는 처음부터 채워진 것으로 취급
+    space_mask = sum(1 << i for i, char in enumerate(chars) if char == " ")
+
+    cols = request.columns
+    rows = (n // cols) + (1 if n % cols else 0)
+    coords = [(CARD_MARGIN + (i % cols) * SLOT_SIZE, CARD_MARGIN + (i // cols) * SLOT_SIZE) for i in range(n)]
+    card_size = (cols * SLOT_SIZE + CARD_MARGIN * 2, rows * SLOT_SIZE + CARD_MARGIN * 2)
     
-    rooms_db[room_id] = RoomData(
-        slots=new_slots,
+    await asyncio.to_thread(_create_blob, _blob_path(room_id))
+    evicted_ids = rooms_db.set(room_id, RoomData(
+        chars=chars,
+        filled_mask=space_mask,
+        free_mask=((1 << n) - 1) & ~space_mask,
+        users=[None] * n,
+        messages=[None] * n,
+        reserved_by=[None] * n,
         columns=request.columns,
-        open_time=request.open_time
-    )
+        open_time=request.open_time,
+        open_minute=open_minute,
+        coords=coords,
+        card_size=card_size
+    ))
+    for evicted_id in evicted_ids: await asyncio.to_thread(_remove_room_files, evicted_id)
     return {"message": "방 생성 완료!", "room_id": room_id}
 
 @app.get("/status/{room_id}")
-def check_status(room_id: str):
-    if room_id not in rooms_db: return {"error": "존재하지 않는 방입니다."}
-    room = rooms_db[room_id]
-    now = datetime.now().strftime("%Y-%m-%dT%H:%M")
-    is_open = now >= room.open_time 
-    return { "is_open": is_open, "open_time": room.open_time, "slots": room.slots, "columns": room.columns }
+async def check_status(room_id: str, request: Request):
+    room = rooms_db.get(room_id)
+    if room is None: return {"error": "존재하지 않는 방입니다."}
+    is_open = _is_open(room)
+    # 응답 내용은 채움/예약 비트맵과 오픈 여부로만 바뀜 → 그대로면 304 (직렬화 생략)
+    etag = f'"{room.filled_mask:x}-{room.reserved_mask:x}-{int(is_open)}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag: return Response(status_code=304, headers=headers)
+    filled_bits = format(room.filled_mask, f"0{len(room.chars)}b")[::-1]
+    slots = [
+        Slot(position=i, char=char, user=room.users[i], message=room.messages[i],
+             is_filled=filled_bits[i] == "1", reserved_by=room.reserved_by[i])
+        for i, char in enumerate(room.chars)
+    ]
+    # 직접 Response 를 반환해서 FastAPI 의 jsonable_encoder 변환을 건너뜀
+    return ORJSONResponse({ "is_open": is_open, "open_time": room.open_time, "slots": slots, "columns": room.columns }, headers=headers)
 
 @app.get("/")
-def read_root(): return FileResponse("index.html")
+async def read_root(): return FileResponse("index.html")
 @app.get("/host")
-def read_host(): return FileResponse("create.html")
+async def read_host(): return FileResponse("create.html")
 
 @app.get("/img/{room_id}/{position}")
-def get_image(room_id: str, position: int):
-    file_path = f"img_{room_id}_{position}.png"
-    if os.path.exists(file_path): return FileResponse(file_path)
+async def get_image(room_id: str, position: int):
+    room = rooms_db.get(room_id)
+    if room and position in room.image_index:
+        offset, length = room.image_index[position]
+        data = await asyncio.to_thread(_read_blob, _blob_path(room_id), offset, length)
+        return Response(data, media_type="image/png")
     return {"error": "Image not found"}
 
 @app.get("/result_card/{room_id}")
-def get_result_card(room_id: str):
-    file_path = f"result_{room_id}.jpg"
-    if os.path.exists(file_path): return FileResponse(file_path)
+async def get_result_card(room_id: str):
+    room = rooms_db.get(room_id)
+    if room and room.card_ready:
+        # FileResponse 는 헤더(크기)를 먼저 보내고 파일은 나중에 열어서, 그 사이 카드가 교체되면 길이가 어긋남
+        # → 한 번 열어서 읽은 내용 그대로 전송 (카드는 수백 KB 수준)
+        try: data = await asyncio.to_thread(_read_file, f"result_{room_id}.jpg")
+        except FileNotFoundError: return {"error": "Not generated yet"}
+        return Response(data, media_type="image/jpeg")
     return {"error": "Not generated yet"}
 
 @app.post("/reserve/{room_id}")
-def reserve_slot(room_id: str, request: JoinRequest):
-    if room_id not in rooms_db: return {"status": "ERROR", "message": "방이 없습니다."}
-    room = rooms_db[room_id]
-    now = datetime.now().strftime("%Y-%m-%dT%H:%M")
-    if now >= room.open_time: return {"status": "TIME_OVER", "message": "⏰ 마감되었습니다."}
+async def reserve_slot(room_id: str, request: JoinRequest):
+    room = rooms_db.get(room_id)
+    if room is None: return {"status": "ERROR", "message": "방이 없습니다."}
+    if _is_open(room): return {"status": "TIME_OVER", "message": "⏰ 마감되었습니다."}
     
-    for slot in room.slots:
-        if slot.reserved_by == request.user_name and not slot.is_filled:
-             return {"status": "SUCCESS", "assigned_char": slot.char}
-    for slot in room.slots:
-        if not slot.is_filled and slot.reserved_by is None:
-            slot.reserved_by = request.user_name
-            return {"status": "SUCCESS", "assigned_char": slot.char}
+    async with room.lock:
+        idx = room.reserved_by_user.get(request.user_name)
+        if idx is not None and not _is_filled(room, idx):
+            return {"status": "SUCCESS", "assigned_char": room.chars[idx]}
+        idx = _pop_free_slot(room)
+        if idx is not None:
+            room.reserved_mask |= 1 << idx
+            room.reserved_by[idx] = request.user_name
+            room.reserved_by_user[request.user_name] = idx
+            return {"status": "SUCCESS", "assigned_char": room.chars[idx]}
     return {"status": "FULL", "message": "자리가 꽉 찼습니다."}
 
-@app.post("/join/{room_id}")
-def join_room(room_id: str, request: JoinRequest):
-    if room_id not in rooms_db: return {"status": "ERROR", "message": "방이 없습니다."}
-    room = rooms_db[room_id]
+# 본문을 직접 파싱하므로 /docs 용 요청 스키마는 명시
+@app.post("/join/{room_id}", openapi_extra={
+    "requestBody": {"content": {"application/json": {"schema": JoinRequest.model_json_schema()}}, "required": True},
+})
+async def join_room(room_id: str, http_request: Request):
+    # 본문을 직접 파싱: json.loads 가 만드는 수백 KB 짜리 str 을 거치지 않고 image_data 를 바로 bytes 로
+    try: request = JoinRequest.model_validate_json(await http_request.body())
+    except ValidationError as e:
+        raise RequestValidationError([{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)])
+    room = rooms_db.get(room_id)
+    if room is None: return {"status": "ERROR", "message": "방이 없습니다."}
     
-    now = datetime.now().strftime("%Y-%m-%dT%H:%M")
-    if now >= room.open_time: return {"status": "TIME_OVER", "message": "⏰ 마감되었습니다."}
+    if _is_open(room): return {"status": "TIME_OVER", "message": "⏰ 마감되었습니다."}
     
-    target_slot = None
-    for slot in room.slots:
-        if slot.reserved_by == request.user_name and not slot.is_filled:
-            target_slot = slot; break
-    if not target_slot:
-        for slot in room.slots:
-            if not slot.is_filled and slot.reserved_by is None:
-                target_slot = slot; break
-
-    if target_slot:
-        target_slot.user = request.user_name
-        target_slot.message = request.message
-        target_slot.is_filled = True
-        try:
-            header, encoded = request.image_data.split(",", 1)
-            data = base64.b64decode(encoded)
-            file_name = f"img_{room_id}_{target_slot.position}.png"
-            with open(file_name, "wb") as f: f.write(data)
-        except Exception as e: print(f"저장 실패: {e}")
-        return {"status": "SUCCESS"}
-            
-    return {"status": "FULL", "message": "자리 없음"}
+    # 슬롯 배정만 잠그고 디스크 쓰기는 락 밖에서 (같은 방의 다른 참여를 막지 않도록)
+    async with room.lock:
+        idx = room.reserved_by_user.get(request.user_name)
+        if idx is None or _is_filled(room, idx):
+            idx = _pop_free_slot(room)
+        if idx is None: return {"status": "FULL", "message": "자리 없음"}
+        room.users[idx] = request.user_name
+        room.messages[idx] = request.message
+        room.filled_mask |= 1 << idx
+
+    try:
+        # split(",") 대신 헤더 위치만 찾아서 memoryview 슬라이스로 디코딩 (페이로드 복사 없음)
+        comma = request.image_data.find(b",")
+        if comma < 0: raise ValueError("data URI 형식이 아닙니다.")
+        data = pybase64.b64decode(memoryview(request.image_data)[comma + 1:], validate=False)
+        # append 위치는 await 전에 예약 → 동시 참여끼리 겹치지 않음
+        offset = room.blob_size
+        room.blob_size += len(data)
+        await asyncio.to_thread(_write_blob, _blob_path(room_id), offset, data)
+        room.image_index[idx] = (offset, len(data))
+    except Exception as e: print(f"저장 실패: {e}")
+    return {"status": "SUCCESS"}
+
+# 카드 렌더는 CPU 를 많이 써서 동시 실행 수를 코어 수 - 1 로 제한 (다른 API 용 스레드 확보)
+CARD_CONCURRENCY = max(1, (os.cpu_count() or 2) - 1)
+CARD_QUEUE_TIMEOUT = 30  # 초
+# import 시점에 만들면 처음 대기한 이벤트 루프에 묶이므로 루프마다 따로 생성
+_card_sems: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+def _card_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    sem = _card_sems.get(loop)
+    if sem is None: sem = _card_sems[loop] = asyncio.Semaphore(CARD_CONCURRENCY)
+    return sem
+
+def _card_signature(room: RoomData) -> bytes:
+    # 카드 결과는 채워진 슬롯과 저장된 이미지(blob 위치)로만 결정됨
+    h = hashlib.blake2b(digest_size=8)
+    h.update(room.filled_mask.to_bytes((len(room.chars) + 7) // 8 or 1, "little"))
+    for position, (offset, length) in sorted(room.image_index.items()):
+        h.update(f"|{position}:{offset}:{length}".encode())
+    return h.digest()
+
+def _card_busy_response() -> ORJSONResponse:
+    return ORJSONResponse(status_code=503, content={"error": "카드 생성 요청이 많습니다. 잠시 후 다시 시도해주세요."})
 
 @app.post("/make-card/{room_id}")
-def make_card(room_id: str):
-    if room_id not in rooms_db: return {"error": "No Room"}
-    room = rooms_db[room_id]
-    
-    cols = room.columns
-    total_slots = len(room.slots)
-    rows = (total_slots // cols) + (1 if total_slots % cols else 0)
-    
-    slot_size = 120    
-    margin = 40  # 외곽 여백 (이 부분도 빨간 니트로 채워짐)
-    
-    # 전체 캔버스 크기
-    width = (cols * slot_size) + (margin * 2)
-    height = (rows * slot_size) + (margin * 2)
+async def make_card(room_id: str):
+    room = rooms_db.get(room_id)
+    if room is None: return {"error": "No Room"}
+    # 지난 렌더 이후 바뀐 게 없으면 기존 result 파일 그대로 사용
+    if room.card_ready and room.card_sig == _card_signature(room): return {"message": "완료 (cached)"}
+    # 방 렌더 락 + 전역 렌더 슬롯 대기를 합쳐서 CARD_QUEUE_TIMEOUT 안에 못 잡으면 503
+    deadline = asyncio.get_running_loop().time() + CARD_QUEUE_TIMEOUT
+    # 같은 방 렌더는 한 번에 하나 - 연속 클릭은 앞선 렌더를 기다렸다가 캐시를 다시 확인
+    try:
+        async with asyncio.timeout_at(deadline): await room.render_lock.acquire()
+    except TimeoutError:
+        return _card_busy_response()
+    try:
+        sig = _card_signature(room)
+        if room.card_ready and room.card_sig == sig: return {"message": "완료 (cached)"}
+        # 동시 렌더 수 제한
+        card_sem = _card_semaphore()
+        try:
+            async with asyncio.timeout_at(deadline): await card_sem.acquire()
+        except TimeoutError:
+            return _card_busy_response()
+        try:
+            # PIL 디코딩/리사이즈/인코딩은 전부 블로킹 → 스레드에서 처리
+            tmp_file = await asyncio.to_thread(_render_card, room_id, room)
+        finally:
+            card_sem.release()
+        # 다 쓴 파일로 교체 → /result_card 는 항상 온전한 카드만 읽음
+        await asyncio.to_thread(os.replace, tmp_file, f"result_{room_id}.jpg")
+        # 그 사이 방이 정리됐다면 방금 만든 카드도 치움
+        if room.evicted:
+            await asyncio.to_thread(_remove_room_files, room_id)
+            return {"error": "No Room"}
+        room.card_ready = True
+        room.card_sig = sig
+        return {"message": "완료"}
+    finally:
+        room.render_lock.release()
+
+def _render_card(room_id: str, room: RoomData) -> str:
+    # 전체 캔버스 크기 (방 생성 시 계산됨)
+    width, height = room.card_size
     
     # [핵심] 배경: 크리스마스 레드 (#b71c1c)
     bg_color = (183, 28, 28) 
     dot_color = (160, 20, 20) # 배경 패턴용 더 진한 빨강
     
-    canvas = Image.new('RGB', (width, height), color=bg_color)
-    draw = ImageDraw.Draw(canvas)
-
-    # [디자인] 배경 전체에 니트 구멍 패턴 그리기 (자동 채움 효과)
-    # 픽셀 사이즈 16px 기준 (HTML과 동일 비율) -> 120px 안에 약 7.5개... 
-    # 여기서는 단순화를 위해 20px 간격으로 점을 찍습니다.
-    for py in range(0, height, 15):
-        for px in range(0, width, 15):
-            draw.ellipse([px, py, px+2, py+2], fill=dot_color)
-    
-    start_x = margin
-    start_y = margin
+    # [디자인] 배경 전체에 니트 구멍 패턴 (자동 채움 효과) - 캐시된 배경을 복사해서 사용
+    canvas = _knit_background(width, height, bg_color, dot_color).copy()
+    s = SLOT_SIZE
 
-    for slot in room.slots:
-        col_idx = slot.position % cols
-        row_idx = slot.position // cols
-        
-        x = start_x + (col_idx * slot_size)
-        y = start_y + (row_idx * slot_size)
-        
+    # 참여자 이미지는 blob 하나를 mmap 해서 한 번에 읽음
+    index = dict(room.image_index)
+    blob = None
+    if index:
+        try:
+            with open(_blob_path(room_id), "rb") as f:
+                blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            # 렌더 도중 방이 LRU 에서 정리됨 → 배경만 있는 카드로
+            index = {}
+    
+    for position, (char, (x, y)) in enumerate(zip(room.chars, room.coords)):
         # 공백(Space)인 경우에도 빨간 배경이 유지되므로 자연스러움
-        if slot.char == " ": continue 
+        if char == " ": continue 
         
         try:
-            if slot.is_filled and slot.user:
-                img_path = f"img_{room_id}_{slot.position}.png"
-                if os.path.exists(img_path):
-                    user_img = Image.open(img_path).convert("RGBA")
-                    user_img = user_img.resize((slot_size, slot_size), Image.Resampling.LANCZOS)
-                    # 붙여넣기
-                    canvas.paste(user_img, (x, y), mask=user_img)
+            if _is_filled(room, position) and room.users[position]:
+                if position in index:
+                    thumb = _load_thumb(room_id, position, blob, *index[position])
+                    # 캔버스 배열에 바로 복사 (알파가 있을 때만 블렌딩)
+                    if thumb.shape[2] == 3:
+                        canvas[y:y+s, x:x+s] = thumb
+                    else:
+                        region = canvas[y:y+s, x:x+s].astype(np.uint16)
+                        alpha = thumb[:, :, 3:].astype(np.uint16)
+                        blended = thumb[:, :, :3] * alpha + region * (255 - alpha) + 127
+                        canvas[y:y+s, x:x+s] = blended // 255
             else:
                 # [선택] 아직 안 채워진 글자 자리 처리 (약하게 표시할지 말지)
                 # 여기서는 비워둡니다 (빨간 배경이 보임)
@@ -197,6 +436,21 @@ def make_card(room_id: str):
         except Exception as e: 
             print(f"이미지 병합 오류: {e}")
             
-    out_file = f"result_{room_id}.jpg"
-    canvas.save(out_file, quality=95)
-    return {"message": "완료"}
+    if blob is not None: blob.close()
+
+    # 렌더마다 별도 임시 파일에 쓰고, 교체는 호출한 쪽(이벤트 루프)에서
+    fd, tmp_file = tempfile.mkstemp(dir=".", prefix=f"result_{room_id}_", suffix=".jpg")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            # 공유용 카드라 95 화질은 과함 → 85 + 4:2:0 + progressive 로 파일 크기 축소
+            Image.fromarray(canvas).save(f, "JPEG", quality=85, subsampling=2, optimize=True, progressive=True)
+        return tmp_file
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+
+if __name__ == "__main__":
+    import uvicorn
+    # uvloop 이벤트 루프 + httptools 파서 (keep-alive 는 uvicorn 기본값 사용)
+    # rooms_db 가 프로세스 메모리에 있으므로 워커는 1개만 - 늘리려면 Redis 같은 공유 저장소로 옮겨야 함
+    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", 8000)), loop="uvloop", http="httptools")